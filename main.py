@@ -1,19 +1,163 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import atexit
+import hashlib
+import heapq
+import html
+import itertools
 import json
+import sqlite3
 import configparser
 import logging
+import math
+import queue
+import random
 import time
 from datetime import datetime, timedelta
-import schedule
 import threading
-from urllib.parse import urlencode
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
 import os
 from typing import List, Dict, Optional, Tuple
 
+try:
+    import orjson
+except ImportError:  # orjson ixtiyoriy - bo'lmasa stdlib json ishlatiladi
+    orjson = None
+
+
+# .get(..., {}) har missda yangi dict ajratmasligi uchun umumiy sentinel
+_EMPTY: Dict = {}
+
+# Hamma xabarlarda ishlatiladigan vaqt formati
+_STRFTIME = '%Y-%m-%d %H:%M:%S'
+
+
+def _json_dumps(obj) -> bytes:
+    """JSON payload ni bytes ga serializatsiya qilish (orjson bo'lsa C tezligida)"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+class BloomFilter:
+    """Ixcham Bloom filter - is_processed uchun L1 kesh
+
+    Negativ javob aniq ("ko'rilmagan"), pozitivda SQLite so'raladi; ~1%
+    false positive bilan har bir element uchun ~1 bayt xotira yetadi.
+    """
+
+    def __init__(self, capacity: int = 100000, error_rate: float = 0.01):
+        # Optimal o'lchamlar: m = -n*ln(p)/ln(2)^2, k = (m/n)*ln(2)
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _indexes(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little')
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str) -> None:
+        for idx in self._indexes(item):
+            self._bits[idx >> 3] |= 1 << (idx & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[idx >> 3] & (1 << (idx & 7)) for idx in self._indexes(item))
+
+
+class TokenBucket:
+    """Bitta host uchun token bucket rate limiter (thread-safe)"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate  # sekundiga token
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Bitta token olish, yetarli bo'lmasa kutish"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
 class HeadHunterBitrixIntegration:
+    # HH kontakt turi -> lead maydoni (contact extraction dispatch)
+    CONTACT_FIELDS = {'email': 'email', 'cell': 'phone', 'phone': 'phone'}
+
+    # Bitrix batch.json bitta chaqiruvda qabul qiladigan sub-so'rovlar limiti
+    BITRIX_BATCH_SIZE = 50
+
+    # Telegram xabarlarini birlashtirish: shu oyna ichida kelganlari bitta
+    # xabar bo'lib ketadi (Telegram 4096 belgi limiti uchun soni chegaralangan)
+    TG_COALESCE_WINDOW = 1.0
+    TG_COALESCE_LIMIT = 8
+
+    # format_comments uchun (manba, kalit, shablon) jadvali - 6 ta alohida
+    # branch o'rniga bitta loop
+    COMMENT_FIELDS = (
+        ('resume', 'alternate_url', 'CV: {}'),
+        ('negotiation', 'created_at', 'Ariza vaqti: {}'),
+        ('resume', 'title', 'Kasb: {}'),
+        ('resume', 'age', 'Yoshi: {}'),
+    )
+
+    # Telegram xabar shablonlari - bir marta kompilyatsiya qilinadi,
+    # format_map + defaultdict yo'q maydonlarni 'N/A' qiladi
+    SUCCESS_TMPL = (
+        "✅ <b>Yangi lead yaratildi!</b>\n\n"
+        "🆔 Lead ID: {lead_id}\n"
+        "👤 Ism: {NAME}\n"
+        "👤 Familiya: {LAST_NAME}\n"
+        "📞 Telefon: {phone}\n"
+        "📧 Email: {email}\n"
+        "💼 Lavozim: {TITLE}\n\n"
+        "🕐 Vaqt: {now}\n"
+        "🔗 Manba: HeadHunter.uz"
+    )
+
+    ERROR_TMPL = (
+        "❌ <b>Xatolik yuz berdi!</b>\n\n"
+        "👤 Ism: {NAME}\n"
+        "👤 Familiya: {LAST_NAME}\n"
+        "🚫 Sabab: {error}\n\n"
+        "🕐 Vaqt: {now}"
+    )
+
+    LOG_TMPL = (
+        "📗 <b>Sistema Logi</b>\n\n"
+        "{message}\n\n"
+        "🕐 Vaqt: {now}"
+    )
+
+    START_TMPL = (
+        "🚀 <b>HeadHunter-Bitrix24 tizimi ishga tushdi!</b>\n\n"
+        "⏰ Tekshirish intervali: har 10 minut\n"
+        "📅 Boshlash vaqti: {ts}\n"
+        "🔧 Versiya: 2.0 (yaxshilangan)"
+    )
+
     def __init__(self, config_file='config.ini'):
         self.config = configparser.ConfigParser()
         self.config.read(config_file, encoding='utf-8')
+        self.config_file = config_file
+
+        # Config yozuvlari atomar bo'lishi uchun (parallel refresh + o'ldirilgan
+        # process yarim yozilgan config.ini qoldirmasin)
+        self._config_lock = threading.Lock()
         
         # API ma'lumotlari
         self.hh_client_id = self.config.get('HEADHUNTER', 'client_id')
@@ -26,21 +170,55 @@ class HeadHunterBitrixIntegration:
         
         # Refresh token
         self.hh_refresh_token = self.config.get('HEADHUNTER', 'refresh_token', fallback='').strip()
+
+        # Tayyor auth headers kesh - har bir so'rovda dict/f-string qurmaslik uchun,
+        # faqat token yangilanganda qayta quriladi
+        self._cached_auth_headers: Optional[Dict[str, str]] = None
+        if self.hh_access_token:
+            self._cached_auth_headers = {
+                'Authorization': f'Bearer {self.hh_access_token}',
+                'Content-Type': 'application/json'
+            }
         
         # Token expiry tracking
         token_expires_str = self.config.get('HEADHUNTER', 'token_expires_at', fallback='')
         self.token_expires_at = None
+        # Monotonic deadline - is_token_expired hot path da datetime.now()
+        # o'rniga bitta float taqqoslash bo'lsin uchun (5 minut zaxira bilan)
+        self._token_expires_monotonic = None
         if token_expires_str:
             try:
                 self.token_expires_at = datetime.fromisoformat(token_expires_str)
+                remaining = (self.token_expires_at - datetime.now()).total_seconds()
+                self._token_expires_monotonic = time.monotonic() + remaining - 300
             except ValueError:
                 pass
         
         # API base URLs - tashkent uchun API endpoint
         self.hh_api_base = "https://api.hh.ru"  # Global API endpoint
         self.hh_oauth_base = "https://hh.ru"    # Global OAuth endpoint
+
+        # Authorization URL parametrlari statik - bir marta qurib qo'yamiz
+        self._auth_url = f"{self.hh_oauth_base}/oauth/authorize?" + urlencode({
+            'response_type': 'code',
+            'client_id': self.hh_client_id,
+            'redirect_uri': self.hh_redirect_uri,
+            'scope': 'employer_vacancies employer_negotiations'
+        })
         
         self.bitrix_webhook = self.config.get('BITRIX24', 'webhook_url')
+
+        # REST bazasi - webhook oxiridagi metod nomini olib tashlaymiz
+        api_base = self.bitrix_webhook.rstrip('/')
+        for suffix in ('crm.lead.add.json', 'crm.lead.add'):
+            if api_base.endswith(suffix):
+                api_base = api_base[:-len(suffix)].rstrip('/')
+                break
+        self.bitrix_api_base = api_base
+        self.bitrix_batch_url = api_base + '/batch.json'
+
+        # Health check probe keshi (monotonik vaqt, natija)
+        self._bitrix_probe_cache: Optional[Tuple[float, bool]] = None
         
         self.telegram_token = self.config.get('TELEGRAM', 'bot_token')
         self.telegram_chat_id = self.config.get('TELEGRAM', 'chat_id')
@@ -50,6 +228,24 @@ class HeadHunterBitrixIntegration:
         self.session.headers.update({
             'User-Agent': 'HH-Bitrix-Integration/2.0 (integration@company.uz)'
         })
+
+        # Katta connection pool + transport-level retry: parallel workerlar
+        # pool kutib qolmasin va TLS qayta-qayta ochilmasin. 429/5xx retry
+        # ham shu yerda - urllib3 Retry-After ga bo'ysunadi va ulanishni
+        # qayta ishlatadi
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=['GET', 'POST'],
+                respect_retry_after_header=True
+            )
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         
         # Logging sozlash
         logging.basicConfig(
@@ -62,115 +258,202 @@ class HeadHunterBitrixIntegration:
         )
         self.logger = logging.getLogger(__name__)
         
-        # Processed IDs ni saqlash uchun
-        self.processed_ids_file = 'processed_applications.txt'
-        self.processed_ids = self.load_processed_ids()
-        
-        # Rate limiting
-        self.last_request_time = 0
-        self.min_request_interval = 1.0  # seconds
+        # Processed IDs ni saqlash uchun SQLite: membership tekshiruvi diskda
+        # O(1), tozalash bitta DELETE, startupda butun set RAM ga yuklanmaydi
+        self.processed_db_file = 'processed.db'
+        self.processed_ids_file = 'processed_applications.txt'  # legacy, faqat migratsiya uchun
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(self.processed_db_file, check_same_thread=False)
+        # auto_vacuum yangi db da ishlaydi - bo'shagan sahifalar incremental_vacuum
+        # bilan qaytariladi, db fayli cheksiz o'smaydi
+        self._db.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS processed(id TEXT PRIMARY KEY, ts INTEGER)')
+        # ts bo'yicha index - tozalash DELETE i to'liq skan emas, range bo'lsin
+        self._db.execute('CREATE INDEX IF NOT EXISTS idx_processed_ts ON processed(ts)')
+        self._db.commit()
+        self._migrate_legacy_ids()
+        atexit.register(self.flush_ids)
+
+        # Bloom filter - is_processed oldidagi L1 kesh: odatiy "hali
+        # ko'rilmagan" holatda SELECT umuman ishlamaydi
+        self._bloom = BloomFilter(capacity=100000, error_rate=0.01)
+        with self._db_lock:
+            for (existing_id,) in self._db.execute('SELECT id FROM processed'):
+                self._bloom.add(existing_id)
         
-        # Retry configuration
-        self.max_retries = 3
-        self.retry_delay = 5
+        # Rate limiting - har bir host uchun alohida token bucket, shunda
+        # HH, Bitrix va Telegram bir-birini sekinlashtirmaydi
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._buckets_lock = threading.Lock()
+        self._bucket_rates = {
+            'api.hh.ru': 5.0,
+            'hh.ru': 5.0,
+            'api.telegram.org': 30.0,
+            urlsplit(self.bitrix_webhook).netloc: 2.0,
+        }
+        self._default_bucket_rate = 2.0
+
+        # Scheduler xatoliklari uchun adaptiv backoff (sekund)
+        self._err_backoff = 30
+
+        # Parallel so'rovlar uchun worker soni
+        self.max_workers = 8
+
+        # Single-flight token refresh: parallel workerlar bitta refresh ni bo'lishadi
+        self._refresh_lock = threading.Lock()
+        self._refresh_future: Optional[Future] = None
+        self._refresh_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='token-refresh')
         
-        # Boshlash vaqtini saqlash
+        # Health check problari uchun alohida kichik pool - ikkala proba
+        # parallel yuradi va hech biri job threadini timeout dan uzoq ushlamaydi
+        self._hc_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='hc')
+
+        # Rejalangan joblar fon poolda ishlaydi - scheduler tick tarmoq I/O
+        # da bloklanmaydi va joblar bir-birini kutmaydi
+        self._jobs_pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix='job')
+        self._jobs_lock = threading.Lock()
+        self._job_futures: Dict = {}
+
+        # Telegram xabarlari fon threadda yuboriladi - lead qayta ishlash
+        # yo'lida Telegram RTT to'lanmasligi uchun
+        self._tg_queue: queue.Queue = queue.Queue()
+        self._tg_thread = threading.Thread(target=self._tg_worker, daemon=True, name='tg-sender')
+        self._tg_thread.start()
+
+        # Boshlash vaqtini saqlash (uptime monotonik soatdan hisoblanadi)
         self.start_time = datetime.now()
+        self._start_monotonic = time.monotonic()
     
-    def load_processed_ids(self) -> set:
-        """Qayta ishlanmasligi uchun ID larni yuklash"""
+    def _migrate_legacy_ids(self) -> None:
+        """Eski processed_applications.txt dan SQLite ga bir martalik ko'chirish"""
         try:
-            if os.path.exists(self.processed_ids_file):
-                with open(self.processed_ids_file, 'r') as f:
-                    return set(line.strip() for line in f if line.strip())
-            return set()
+            if not os.path.exists(self.processed_ids_file):
+                return
+            # Bytes darajasida o'qish: C splitlines + har bir ID uchun bitta decode
+            with open(self.processed_ids_file, 'rb') as f:
+                ids = set(filter(None, f.read().splitlines()))
+            if ids:
+                now = int(time.time())
+                with self._db_lock, self._db:
+                    self._db.executemany('INSERT OR IGNORE INTO processed VALUES(?, ?)',
+                                         ((app_id.decode(), now) for app_id in ids))
+            os.replace(self.processed_ids_file, self.processed_ids_file + '.migrated')
+            self.logger.info(f"{len(ids)} ta ID SQLite ga ko'chirildi")
         except Exception as e:
-            self.logger.error(f"ID yuklashda xatolik: {str(e)}")
-            return set()
-    
+            self.logger.error(f"ID migratsiyasida xatolik: {str(e)}")
+
+    def is_processed(self, app_id: str) -> bool:
+        """ID avval qayta ishlanganligini tekshirish (Bloom -> SQLite)"""
+        # Bloom "yo'q" desa, aniq yo'q - DB so'rovisiz qaytamiz
+        if app_id not in self._bloom:
+            return False
+        with self._db_lock:
+            row = self._db.execute('SELECT 1 FROM processed WHERE id=? LIMIT 1', (app_id,)).fetchone()
+        return row is not None
+
+    def processed_count(self) -> int:
+        """Qayta ishlangan ID lar soni"""
+        with self._db_lock:
+            return self._db.execute('SELECT COUNT(*) FROM processed').fetchone()[0]
+
     def save_processed_id(self, app_id: str) -> None:
-        """ID ni saqlash"""
+        """ID ni saqlash (commit flush_ids da - har bir ID uchun fsync to'lanmaydi)"""
         try:
-            with open(self.processed_ids_file, 'a') as f:
-                f.write(f"{app_id}\n")
-            self.processed_ids.add(app_id)
+            with self._db_lock:
+                self._db.execute("INSERT OR IGNORE INTO processed VALUES(?, strftime('%s','now'))", (app_id,))
+                self._bloom.add(app_id)
         except Exception as e:
             self.logger.error(f"ID saqlashda xatolik: {str(e)}")
             self.send_telegram_error({}, f"ID saqlashda xatolik: {str(e)}")
+
+    def flush_ids(self) -> None:
+        """Kutilayotgan yozuvlarni diskka commit qilish"""
+        try:
+            with self._db_lock:
+                self._db.commit()
+        except Exception as e:
+            self.logger.error(f"ID flush qilishda xatolik: {str(e)}")
     
+    def _write_config(self) -> None:
+        """Config ni atomar yozish: temp fayl + os.replace
+
+        Process yozish o'rtasida o'lsa ham config.ini hech qachon yarim
+        holatda qolmaydi; lock parallel yozuvchilarni ketma-ketlashtiradi.
+        """
+        tmp_file = self.config_file + '.tmp'
+        with self._config_lock:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                self.config.write(f)
+            os.replace(tmp_file, self.config_file)
+
     def save_token_to_config(self, access_token: str, refresh_token: str = None, expires_in: int = None) -> None:
         """Token ma'lumotlarini config faylga saqlash"""
         try:
             self.config.set('HEADHUNTER', 'access_token', access_token)
             if refresh_token:
                 self.config.set('HEADHUNTER', 'refresh_token', refresh_token)
-            
+
             if expires_in:
                 expires_at = datetime.now() + timedelta(seconds=int(expires_in))
                 self.config.set('HEADHUNTER', 'token_expires_at', expires_at.isoformat())
                 self.token_expires_at = expires_at
-            
-            with open('config.ini', 'w', encoding='utf-8') as f:
-                self.config.write(f)
+                self._token_expires_monotonic = time.monotonic() + int(expires_in) - 300
+
+            self._write_config()
+
+            # Keshni yangi token bilan qayta qurish
+            self._cached_auth_headers = {
+                'Authorization': f'Bearer {access_token}',
+                'Content-Type': 'application/json'
+            }
         except Exception as e:
             self.logger.error(f"Config saqlashda xatolik: {str(e)}")
     
     def is_token_expired(self) -> bool:
-        """Token muddati tugaganligini tekshirish"""
-        if not self.token_expires_at:
-            return False
-        return datetime.now() >= self.token_expires_at - timedelta(minutes=5)  # 5 minut oldin yangilash
-    
-    def rate_limit(self) -> None:
-        """Rate limiting"""
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
-        if time_since_last < self.min_request_interval:
-            time.sleep(self.min_request_interval - time_since_last)
-        self.last_request_time = time.time()
+        """Token muddati tugaganligini tekshirish (5 minut zaxira monotonik deadline ichida)"""
+        return self._token_expires_monotonic is not None and time.monotonic() >= self._token_expires_monotonic
     
+    def _bucket_for(self, url: str) -> TokenBucket:
+        """URL hostiga mos token bucket ni olish (kerak bo'lsa yaratish)"""
+        host = urlsplit(url).netloc
+        with self._buckets_lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self._bucket_rates.get(host, self._default_bucket_rate))
+                self._buckets[host] = bucket
+        return bucket
+
     def make_request(self, method: str, url: str, **kwargs) -> Optional[requests.Response]:
-        """Rate limited va retry bilan so'rov yuborish"""
-        for attempt in range(self.max_retries):
-            try:
-                self.rate_limit()
-                
-                # Default timeout
-                if 'timeout' not in kwargs:
-                    kwargs['timeout'] = 30
-                
-                response = self.session.request(method, url, **kwargs)
-                
-                # Rate limit handling
-                if response.status_code == 429:
-                    retry_after = int(response.headers.get('Retry-After', self.retry_delay))
-                    self.logger.warning(f"Rate limit hit, waiting {retry_after} seconds")
-                    time.sleep(retry_after)
-                    continue
-                
-                return response
-                
-            except requests.exceptions.RequestException as e:
-                if attempt == self.max_retries - 1:
-                    self.logger.error(f"So'rov {self.max_retries} marta amalga oshmadi: {str(e)}")
-                    return None
-                else:
-                    self.logger.warning(f"So'rov xatolik (urinish {attempt + 1}): {str(e)}")
-                    time.sleep(self.retry_delay * (attempt + 1))
-        
-        return None
+        """Rate limited so'rov yuborish (retry urllib3 Retry siyosatida)"""
+        # json= o'rniga oldindan serializatsiya qilingan bytes yuboramiz -
+        # requests ning stdlib json.dumps yo'lidan tezroq
+        if 'json' in kwargs:
+            kwargs['data'] = _json_dumps(kwargs.pop('json'))
+            headers = kwargs.get('headers')
+            if headers is None:
+                kwargs['headers'] = {'Content-Type': 'application/json'}
+            elif 'Content-Type' not in headers:
+                kwargs['headers'] = {**headers, 'Content-Type': 'application/json'}
+
+        try:
+            self._bucket_for(url).acquire()
+
+            # Default timeout
+            if 'timeout' not in kwargs:
+                kwargs['timeout'] = 30
+
+            return self.session.request(method, url, **kwargs)
+
+        except requests.exceptions.RequestException as e:
+            # 429/5xx/transport retrylar urllib3 ichida bo'lib bo'ldi
+            self.logger.error(f"So'rov amalga oshmadi: {str(e)}")
+            return None
     
     def get_hh_authorization_url(self) -> str:
         """HeadHunter uchun authorization URL olish"""
-        params = {
-            'response_type': 'code',
-            'client_id': self.hh_client_id,
-            'redirect_uri': self.hh_redirect_uri,
-            'scope': 'employer_vacancies employer_negotiations'
-        }
-        
-        auth_url = f"{self.hh_oauth_base}/oauth/authorize?" + urlencode(params)
-        return auth_url
+        return self._auth_url
     
     def get_access_token(self, authorization_code: str) -> Optional[str]:
         """Authorization code orqali access token olish"""
@@ -283,17 +566,38 @@ class HeadHunterBitrixIntegration:
             self.send_telegram_error({}, error_msg)
             return False
     
+    def _refresh_single_flight(self) -> bool:
+        """Parallel chaqiruvlar uchun bitta refresh ni bo'lishish
+
+        Bir nechta worker bir vaqtda muddati tugagan tokenni ko'rsa, faqat
+        bittasi refresh qiladi, qolganlari o'sha natijani kutadi. Bu OAuth
+        kvotani tejaydi va config.ini ustida yozish poygasini oldini oladi.
+        """
+        with self._refresh_lock:
+            future = self._refresh_future
+            if future is None:
+                future = self._refresh_pool.submit(self.refresh_access_token)
+                self._refresh_future = future
+        try:
+            return future.result()
+        finally:
+            with self._refresh_lock:
+                if self._refresh_future is future:
+                    self._refresh_future = None
+
     def get_auth_headers(self) -> Dict[str, str]:
         """Authentication headers olish"""
         # Token muddatini tekshirish va yangilash
         if self.is_token_expired():
-            if not self.refresh_access_token():
+            if not self._refresh_single_flight():
                 raise Exception("Token muddati tugagan va yangilab bo'lmayapti")
-        
-        return {
-            'Authorization': f'Bearer {self.hh_access_token}',
-            'Content-Type': 'application/json'
-        }
+
+        if self._cached_auth_headers is None:
+            self._cached_auth_headers = {
+                'Authorization': f'Bearer {self.hh_access_token}',
+                'Content-Type': 'application/json'
+            }
+        return self._cached_auth_headers
     
     def test_api_access(self) -> Tuple[bool, str]:
         """API ga kirishni test qilish"""
@@ -301,47 +605,108 @@ class HeadHunterBitrixIntegration:
             return False, "Access token bo'sh yoki mavjud emas"
         
         try:
-            headers = self.get_auth_headers()
             me_url = f"{self.hh_api_base}/me"
-            self.logger.info(f"API test so'rovi: {me_url}")
-            
-            response = self.make_request('GET', me_url, headers=headers)
-            
-            if not response:
-                return False, "API ga so'rov yuborib bo'lmadi"
-            
-            self.logger.info(f"API test javob status: {response.status_code}")
-            
-            if response.status_code == 200:
-                user_data = response.json()
-                is_employer = user_data.get('is_employer', False)
-                email = user_data.get('email', 'N/A')
-                
-                if is_employer:
-                    return True, f"Employer account tasdiqlandi: {email}"
+
+            # 401 da bitta refresh + bitta qayta urinish - rekursiyasiz
+            for attempt in range(2):
+                headers = self.get_auth_headers()
+                self.logger.info(f"API test so'rovi: {me_url}")
+
+                response = self.make_request('GET', me_url, headers=headers)
+
+                if not response:
+                    return False, "API ga so'rov yuborib bo'lmadi"
+
+                self.logger.info(f"API test javob status: {response.status_code}")
+
+                if response.status_code == 200:
+                    user_data = response.json()
+                    is_employer = user_data.get('is_employer', False)
+                    email = user_data.get('email', 'N/A')
+
+                    if is_employer:
+                        return True, f"Employer account tasdiqlandi: {email}"
+                    else:
+                        return False, f"Bu account employer emas: {email}"
+                elif response.status_code == 401:
+                    # Token yangilashga bitta harakat, keyin loopning ikkinchi aylanishi
+                    if attempt == 0 and self.hh_refresh_token and self.refresh_access_token():
+                        continue
+                    return False, "Access token yaroqsiz yoki muddati tugagan"
+                elif response.status_code == 403:
+                    try:
+                        error_data = response.json()
+                        oauth_error = error_data.get('oauth_error', '')
+                        description = error_data.get('description', '')
+                        return False, f"Ruxsat yo'q: {description} (oauth_error: {oauth_error})"
+                    except:
+                        return False, f"Ruxsat yo'q - tokenning scope'ini tekshiring: {response.text}"
+                elif response.status_code == 404:
+                    return False, "API endpoint topilmadi - URL'ni tekshiring"
                 else:
-                    return False, f"Bu account employer emas: {email}"
-            elif response.status_code == 401:
-                # Token yangilashga harakat
-                if self.hh_refresh_token and self.refresh_access_token():
-                    return self.test_api_access()  # Recursive call after refresh
-                return False, "Access token yaroqsiz yoki muddati tugagan"
-            elif response.status_code == 403:
-                try:
-                    error_data = response.json()
-                    oauth_error = error_data.get('oauth_error', '')
-                    description = error_data.get('description', '')
-                    return False, f"Ruxsat yo'q: {description} (oauth_error: {oauth_error})"
-                except:
-                    return False, f"Ruxsat yo'q - tokenning scope'ini tekshiring: {response.text}"
-            elif response.status_code == 404:
-                return False, "API endpoint topilmadi - URL'ni tekshiring"
-            else:
-                return False, f"API xatolik: {response.status_code} - {response.text}"
-                
+                    return False, f"API xatolik: {response.status_code} - {response.text}"
+
+            return False, "Access token yaroqsiz yoki muddati tugagan"
+
         except Exception as e:
             return False, f"API test xatolik: {str(e)}"
     
+    def _fetch_items(self, url: str, headers: Dict[str, str], params: Dict) -> List[Dict]:
+        """Bitta sahifani olib, items ro'yxatini qaytarish (worker thread uchun)"""
+        try:
+            self._bucket_for(url).acquire()
+            response = self.session.get(url, headers=headers, params=params, timeout=30)
+            if response.status_code == 200:
+                return response.json().get('items', [])
+            self.logger.warning(f"Sahifa {params.get('page')} uchun xatolik: {response.status_code}")
+        except Exception as e:
+            self.logger.warning(f"Sahifa {params.get('page')} uchun xatolik: {str(e)}")
+        return []
+
+    def _fetch_negotiations(self, vacancy: Dict, headers: Dict[str, str]) -> List[Dict]:
+        """Bitta vakansiya uchun arizalarni olish (worker thread ichida ishlaydi)"""
+        applications = []
+        vacancy_id = vacancy.get('id')
+        vacancy_name = vacancy.get('name', 'Noma\'lum vakansiya')
+        if not vacancy_id:
+            return applications
+
+        negotiations_url = f"{self.hh_api_base}/negotiations"
+        params = {
+            'vacancy_id': vacancy_id,
+            'per_page': 100,
+            'page': 0
+        }
+
+        try:
+            # Session to'g'ridan-to'g'ri ishlatiladi - keep-alive connection pool
+            # workerlar orasida bo'linadi; HH bucket workerlar uchun umumiy
+            self._bucket_for(negotiations_url).acquire()
+            response = self.session.get(negotiations_url, headers=headers, params=params, timeout=30)
+
+            if response.status_code == 200:
+                data = response.json()
+                negotiations = data.get('items', [])
+
+                # Qolgan sahifalar - 100 tadan ortiq ariza tushib qolmasligi uchun
+                for page in range(1, data.get('pages', 1)):
+                    negotiations.extend(self._fetch_items(negotiations_url, headers, {**params, 'page': page}))
+
+                for negotiation in negotiations:
+                    app_id = str(negotiation.get('id', ''))
+                    if app_id and not self.is_processed(app_id):
+                        applications.append({
+                            'negotiation': negotiation,
+                            'vacancy_name': vacancy_name
+                        })
+            else:
+                self.logger.warning(f"Vakansiya {vacancy_id} uchun negotiations xatolik: {response.status_code}")
+
+        except Exception as e:
+            self.logger.warning(f"Vakansiya {vacancy_id} uchun xatolik: {str(e)}")
+
+        return applications
+
     def get_hh_applications(self) -> List[Dict]:
         """HeadHunter dan oxirgi vakansiyalar va arizalarini olish"""
         if not self.hh_access_token:
@@ -354,26 +719,33 @@ class HeadHunterBitrixIntegration:
         
         try:
             headers = self.get_auth_headers()
-            
-            # Employer ID olish
-            me_url = f"{self.hh_api_base}/me"
-            self.logger.info(f"Employer ID so'rovi yuborilmoqda: {me_url}")
-            me_response = self.make_request('GET', me_url, headers=headers)
-            
-            if not me_response or me_response.status_code != 200:
-                error_msg = f"Employer ID olishda xatolik: {me_response.status_code if me_response else 'No response'}"
-                self.logger.error(error_msg)
-                self.send_telegram_error({}, error_msg)
-                return []
-            
-            employer_data = me_response.json()
-            employer_id = employer_data.get('id')
+
+            # Employer ID credentials davomida o'zgarmaydi - keshdan olamiz,
+            # faqat kesh bo'sh bo'lsa /me round-trip qilamiz
+            employer_id = self.config.get('HEADHUNTER', 'employer_id', fallback='').strip()
             if not employer_id:
-                error_msg = "Employer ID topilmadi!"
-                self.logger.error(error_msg)
-                self.send_telegram_error({}, error_msg)
-                return []
-            
+                me_url = f"{self.hh_api_base}/me"
+                self.logger.info(f"Employer ID so'rovi yuborilmoqda: {me_url}")
+                me_response = self.make_request('GET', me_url, headers=headers)
+
+                if not me_response or me_response.status_code != 200:
+                    error_msg = f"Employer ID olishda xatolik: {me_response.status_code if me_response else 'No response'}"
+                    self.logger.error(error_msg)
+                    self.send_telegram_error({}, error_msg)
+                    return []
+
+                employer_data = me_response.json()
+                employer_id = employer_data.get('id')
+                if not employer_id:
+                    error_msg = "Employer ID topilmadi!"
+                    self.logger.error(error_msg)
+                    self.send_telegram_error({}, error_msg)
+                    return []
+
+                employer_id = str(employer_id)
+                self.config.set('HEADHUNTER', 'employer_id', employer_id)
+                self._write_config()
+
             self.logger.info(f"Employer ID: {employer_id}")
             
             # Vakansiyalar olish
@@ -388,6 +760,9 @@ class HeadHunterBitrixIntegration:
             vacancies_response = self.make_request('GET', vacancies_url, headers=headers, params=params)
             
             if not vacancies_response or vacancies_response.status_code != 200:
+                # Auth o'zgargan bo'lishi mumkin - keshdagi employer_id ni bekor qilamiz
+                if vacancies_response is not None and vacancies_response.status_code == 401:
+                    self.config.remove_option('HEADHUNTER', 'employer_id')
                 error_msg = f"Vakansiyalarni olishda xatolik: {vacancies_response.status_code if vacancies_response else 'No response'}"
                 self.logger.error(error_msg)
                 self.send_telegram_error({}, error_msg)
@@ -395,7 +770,17 @@ class HeadHunterBitrixIntegration:
             
             vacancies_data = vacancies_response.json()
             vacancies = vacancies_data.get('items', [])
-            
+
+            # Qolgan sahifalarni parallel olish - 100 tadan ortiq faol
+            # vakansiya bo'lsa ham hech biri tushib qolmaydi
+            total_pages = vacancies_data.get('pages', 1)
+            if total_pages > 1:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    for page_items in executor.map(
+                            lambda p: self._fetch_items(vacancies_url, headers, {**params, 'page': p}),
+                            range(1, total_pages)):
+                        vacancies.extend(page_items)
+
             if not vacancies:
                 info_msg = "Hozirda faol vakansiyalar topilmadi."
                 self.logger.info(info_msg)
@@ -403,43 +788,11 @@ class HeadHunterBitrixIntegration:
             
             self.logger.info(f"{len(vacancies)} ta vakansiya topildi")
             
-            # Har bir vakansiya uchun arizalarni olish
-            for vacancy in vacancies:
-                vacancy_id = vacancy.get('id')
-                vacancy_name = vacancy.get('name', 'Noma\'lum vakansiya')
-                if not vacancy_id:
-                    continue
-                
-                negotiations_url = f"{self.hh_api_base}/negotiations"
-                params = {
-                    'vacancy_id': vacancy_id,
-                    'per_page': 100,
-                    'page': 0
-                }
-                
-                try:
-                    negotiations_response = self.make_request('GET', negotiations_url, headers=headers, params=params)
-                    
-                    if negotiations_response and negotiations_response.status_code == 200:
-                        negotiations_data = negotiations_response.json()
-                        negotiations = negotiations_data.get('items', [])
-                        
-                        for negotiation in negotiations:
-                            app_id = str(negotiation.get('id', ''))
-                            if app_id and app_id not in self.processed_ids:
-                                applications.append({
-                                    'negotiation': negotiation,
-                                    'vacancy_name': vacancy_name
-                                })
-                    else:
-                        error_msg = f"Vakansiya {vacancy_id} uchun negotiations xatolik: {negotiations_response.status_code if negotiations_response else 'No response'}"
-                        self.logger.warning(error_msg)
-                
-                except Exception as e:
-                    error_msg = f"Vakansiya {vacancy_id} uchun xatolik: {str(e)}"
-                    self.logger.warning(error_msg)
-                    continue
-            
+            # Har bir vakansiya uchun arizalarni parallel olish
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for result in executor.map(lambda v: self._fetch_negotiations(v, headers), vacancies):
+                    applications.extend(result)
+
             self.logger.info(f"HeadHunter dan {len(applications)} ta yangi ariza olindi")
             return applications
             
@@ -449,101 +802,124 @@ class HeadHunterBitrixIntegration:
             self.send_telegram_error({}, error_msg)
             return []
     
-    def create_bitrix_lead(self, application_data: Dict) -> bool:
-        """Bitrix24 ga lead yaratish"""
+    def _build_lead_fields(self, application_data: Dict) -> Optional[Dict]:
+        """Ariza ma'lumotlaridan Bitrix lead maydonlarini tayyorlash"""
         try:
             negotiation = application_data.get('negotiation', {})
             vacancy_name = application_data.get('vacancy_name', 'Noma\'lum vakansiya')
             resume = negotiation.get('resume', {})
-            
+
             first_name = resume.get('first_name', '')
             last_name = resume.get('last_name', '')
-            
-            email = ''
-            phone = ''
-            
-            # Kontakt ma'lumotlarini olish
-            if resume.get('contact'):
-                contacts = resume['contact']
-                if isinstance(contacts, list):
-                    for contact in contacts:
-                        contact_type = contact.get('type', {})
-                        if isinstance(contact_type, dict):
-                            if contact_type.get('id') == 'email':
-                                email = contact.get('value', '')
-                            elif contact_type.get('id') in ['cell', 'phone']:
-                                phone = contact.get('value', '')
+
+            # Kontakt ma'lumotlarini olish - dispatch dict orqali
+            found = {}
+            contacts = resume.get('contact')
+            for contact in (contacts if isinstance(contacts, list) else ()):
+                contact_type = (contact.get('type') or {})
+                key = self.CONTACT_FIELDS.get(contact_type.get('id') if isinstance(contact_type, dict) else None)
+                if key and key not in found:
+                    found[key] = contact.get('value', '')
+                    if len(found) == 2:
+                        break
+
+            email = found.get('email', '')
+            phone = found.get('phone', '')
             
             # Lead ma'lumotlarini tayyorlash
-            lead_data = {
-                'fields': {
-                    'NAME': first_name,
-                    'LAST_NAME': last_name,
-                    'EMAIL': [{'VALUE': email, 'VALUE_TYPE': 'WORK'}] if email else [],
-                    'PHONE': [{'VALUE': phone, 'VALUE_TYPE': 'WORK'}] if phone else [],
-                    'TITLE': vacancy_name,
-                    'COMMENTS': self.format_comments(negotiation),
-                    'SOURCE_ID': 'OTHER',
-                    'SOURCE_DESCRIPTION': 'HeadHunter.uz',
-                    'ASSIGNED_BY_ID': 1
-                }
+            return {
+                'NAME': first_name,
+                'LAST_NAME': last_name,
+                'EMAIL': [{'VALUE': email, 'VALUE_TYPE': 'WORK'}] if email else [],
+                'PHONE': [{'VALUE': phone, 'VALUE_TYPE': 'WORK'}] if phone else [],
+                'TITLE': vacancy_name,
+                'COMMENTS': self.format_comments(negotiation),
+                'SOURCE_ID': 'OTHER',
+                'SOURCE_DESCRIPTION': 'HeadHunter.uz',
+                'ASSIGNED_BY_ID': 1
             }
-            
-            self.logger.info(f"Bitrix24 ga lead yuborilmoqda: {vacancy_name}")
-            response = self.make_request('POST', self.bitrix_webhook, json=lead_data)
-            
-            if not response:
-                self.logger.error("Bitrix24 ga so'rov yuborib bo'lmadi")
-                self.send_telegram_error(lead_data['fields'], "Bitrix24 ga so'rov yuborib bo'lmadi")
-                return False
-            
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('result'):
-                    lead_id = result['result']
-                    self.logger.info(f"Lead yaratildi: ID {lead_id}")
-                    self.send_telegram_success(lead_data['fields'], lead_id)
-                    return True
-                else:
-                    error_msg = result.get('error_description', str(result.get('error', 'Noma\'lum xatolik')))
-                    self.logger.error(f"Bitrix xatolik: {error_msg}")
-                    self.send_telegram_error(lead_data['fields'], error_msg)
-                    return False
-            else:
-                error_msg = f"Bitrix API xatolik: {response.status_code} - {response.text}"
-                self.logger.error(error_msg)
-                self.send_telegram_error(lead_data['fields'], error_msg)
-                return False
-                
+
         except Exception as e:
-            error_msg = f"Lead yaratishda xatolik: {str(e)}"
+            error_msg = f"Lead tayyorlashda xatolik: {str(e)}"
             self.logger.error(error_msg)
             self.send_telegram_error({}, error_msg)
-            return False
-    
+            return None
+
+    def _flatten_fields(self, prefix: str, value) -> List[Tuple[str, str]]:
+        """Nested dict/list ni Bitrix REST param ko'rinishiga yoyish (fields[NAME]=...)"""
+        pairs = []
+        if isinstance(value, dict):
+            for key, item in value.items():
+                pairs.extend(self._flatten_fields(f'{prefix}[{key}]', item))
+        elif isinstance(value, list):
+            for i, item in enumerate(value):
+                pairs.extend(self._flatten_fields(f'{prefix}[{i}]', item))
+        else:
+            pairs.append((prefix, '' if value is None else str(value)))
+        return pairs
+
+    def _flush_leads(self, batch: List[Tuple[str, Dict]]) -> int:
+        """Leadlar guruhini bitta batch.json so'rovi bilan yaratish
+
+        50 tagacha crm.lead.add sub-so'rovi bitta HTTP chaqiruvga sig'adi -
+        har bir lead uchun alohida TLS round-trip to'lanmaydi.
+        """
+        if not batch:
+            return 0
+
+        cmd = {
+            f'lead_{i}': 'crm.lead.add?' + urlencode(self._flatten_fields('fields', fields))
+            for i, (_, fields) in enumerate(batch)
+        }
+
+        self.logger.info(f"Bitrix24 ga {len(batch)} ta lead batch yuborilmoqda")
+        response = self.make_request('POST', self.bitrix_batch_url, json={'halt': 0, 'cmd': cmd})
+
+        if not response or response.status_code != 200:
+            error_msg = f"Bitrix batch xatolik: {response.status_code if response else 'No response'}"
+            self.logger.error(error_msg)
+            self.send_telegram_error({}, error_msg)
+            return 0
+
+        result = response.json().get('result', {})
+        created = result.get('result') or {}
+        errors = result.get('result_error') or {}
+
+        success = 0
+        ts = time.strftime(_STRFTIME)  # bitta timestamp butun batch uchun
+        for i, (_, fields) in enumerate(batch):
+            key = f'lead_{i}'
+            lead_id = created.get(key)
+            if lead_id:
+                success += 1
+                self.logger.info(f"Lead yaratildi: ID {lead_id}")
+                self.send_telegram_success(fields, lead_id, ts)
+            else:
+                error = errors.get(key)
+                error_msg = error.get('error_description', str(error)) if isinstance(error, dict) else str(error)
+                self.logger.error(f"Bitrix xatolik: {error_msg}")
+                self.send_telegram_error(fields, error_msg, ts)
+        return success
+
+
     def format_comments(self, negotiation: Dict) -> str:
         """Izohlarni formatlash"""
-        resume = negotiation.get('resume', {})
+        resume = negotiation.get('resume') or _EMPTY
+        sources = {'resume': resume, 'negotiation': negotiation}
         comments = []
-        
-        if resume.get('alternate_url'):
-            comments.append(f"CV: {resume['alternate_url']}")
-        
-        if negotiation.get('created_at'):
-            comments.append(f"Ariza vaqti: {negotiation['created_at']}")
-        
-        if resume.get('title'):
-            comments.append(f"Kasb: {resume['title']}")
-        
-        if resume.get('age'):
-            comments.append(f"Yoshi: {resume['age']}")
-        
-        if resume.get('area', {}).get('name'):
-            comments.append(f"Joylashuv: {resume['area']['name']}")
-        
+
+        for source, key, template in self.COMMENT_FIELDS:
+            value = sources[source].get(key)
+            if value:
+                comments.append(template.format(value))
+
+        area_name = (resume.get('area') or _EMPTY).get('name')
+        if area_name:
+            comments.append(f"Joylashuv: {area_name}")
+
         # Salary information
-        if resume.get('salary'):
-            salary = resume['salary']
+        salary = resume.get('salary')
+        if salary:
             salary_from = salary.get('from')
             salary_to = salary.get('to')
             currency = salary.get('currency', 'UZS')
@@ -561,48 +937,76 @@ class HeadHunterBitrixIntegration:
         
         return '\n'.join(comments)
     
-    def send_telegram_success(self, lead_data: Dict, lead_id: str) -> None:
+    def _message_context(self, lead_data: Dict, ts: Optional[str] = None) -> defaultdict:
+        """Lead maydonlaridan template kontekstini qurish (HTML-safe)
+
+        Foydalanuvchi kiritgan qiymatlar html.escape dan o'tadi, yo'q
+        maydonlar 'N/A' bo'lib qoladi. ts berilsa vaqt qayta hisoblanmaydi -
+        batch ichida bitta timestamp yetarli.
+        """
+        ctx = defaultdict(lambda: 'N/A')
+        for key in ('NAME', 'LAST_NAME', 'TITLE'):
+            value = (lead_data or _EMPTY).get(key)
+            if value:
+                ctx[key] = html.escape(str(value))
+
+        email_list = (lead_data or _EMPTY).get('EMAIL')
+        if email_list:
+            ctx['email'] = html.escape(str(email_list[0].get('VALUE', 'N/A')))
+        phone_list = (lead_data or _EMPTY).get('PHONE')
+        if phone_list:
+            ctx['phone'] = html.escape(str(phone_list[0].get('VALUE', 'N/A')))
+
+        # time.strftime C darajasida ishlaydi - datetime obyekti ajratilmaydi
+        ctx['now'] = ts or time.strftime(_STRFTIME)
+        return ctx
+
+    def send_telegram_success(self, lead_data: Dict, lead_id: str, ts: Optional[str] = None) -> None:
         """Telegram ga muvaffaqiyatli xabar yuborish"""
-        email_value = lead_data.get('EMAIL', [{}])[0].get('VALUE', 'N/A') if lead_data.get('EMAIL') else 'N/A'
-        phone_value = lead_data.get('PHONE', [{}])[0].get('VALUE', 'N/A') if lead_data.get('PHONE') else 'N/A'
-        
-        message = (
-            f"✅ <b>Yangi lead yaratildi!</b>\n\n"
-            f"🆔 Lead ID: {lead_id}\n"
-            f"👤 Ism: {lead_data.get('NAME', 'N/A')}\n"
-            f"👤 Familiya: {lead_data.get('LAST_NAME', 'N/A')}\n"
-            f"📞 Telefon: {phone_value}\n"
-            f"📧 Email: {email_value}\n"
-            f"💼 Lavozim: {lead_data.get('TITLE', 'N/A')}\n\n"
-            f"🕐 Vaqt: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-            f"🔗 Manba: HeadHunter.uz"
-        )
-        
-        self.send_telegram_message(message)
-    
-    def send_telegram_error(self, lead_data: Dict, error: str) -> None:
+        ctx = self._message_context(lead_data, ts)
+        ctx['lead_id'] = lead_id
+        self.send_telegram_message(self.SUCCESS_TMPL.format_map(ctx))
+
+    def send_telegram_error(self, lead_data: Dict, error: str, ts: Optional[str] = None) -> None:
         """Telegram ga xatolik xabarini yuborish"""
-        message = (
-            f"❌ <b>Xatolik yuz berdi!</b>\n\n"
-            f"👤 Ism: {lead_data.get('NAME', 'N/A') if lead_data else 'N/A'}\n"
-            f"👤 Familiya: {lead_data.get('LAST_NAME', 'N/A') if lead_data else 'N/A'}\n"
-            f"🚫 Sabab: {error}\n\n"
-            f"🕐 Vaqt: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        )
-        
-        self.send_telegram_message(message)
-    
+        ctx = self._message_context(lead_data, ts)
+        ctx['error'] = html.escape(str(error))
+        self.send_telegram_message(self.ERROR_TMPL.format_map(ctx))
+
     def send_telegram_log(self, message: str) -> None:
         """Telegram ga log xabarini yuborish"""
-        log_message = (
-            f"📗 <b>Sistema Logi</b>\n\n"
-            f"{message}\n\n"
-            f"🕐 Vaqt: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        )
-        
-        self.send_telegram_message(log_message)
+        ctx = self._message_context(_EMPTY)
+        ctx['message'] = message
+        self.send_telegram_message(self.LOG_TMPL.format_map(ctx))
     
     def send_telegram_message(self, message: str) -> None:
+        """Telegram xabarini navbatga qo'yish (fon thread yuboradi)"""
+        self._tg_queue.put(message)
+
+    def _tg_worker(self) -> None:
+        """Telegram navbatini yuboruvchi fon thread
+
+        1 sekund oynasi ichida yig'ilgan xabarlar bitta POST bilan ketadi -
+        batch qayta ishlashda N ta RTT o'rniga bir nechtasi qoladi.
+        """
+        while True:
+            batch = [self._tg_queue.get()]
+            deadline = time.monotonic() + self.TG_COALESCE_WINDOW
+            while len(batch) < self.TG_COALESCE_LIMIT:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._tg_queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                self._send_telegram_now('\n---\n'.join(batch))
+            finally:
+                for _ in batch:
+                    self._tg_queue.task_done()
+
+    def _send_telegram_now(self, message: str) -> None:
         """Telegram ga xabar yuborish"""
         try:
             url = f"https://api.telegram.org/bot{self.telegram_token}/sendMessage"
@@ -642,29 +1046,36 @@ class HeadHunterBitrixIntegration:
             
             processed_count = 0
             success_count = 0
-            
-            # Har bir arizani qayta ishlash
+
+            # Arizalarni lead maydonlariga aylantirib yig'amiz
+            pending: List[Tuple[str, Dict]] = []
             for application in applications:
                 try:
                     app_id = str(application['negotiation'].get('id', ''))
-                    
-                    if app_id in self.processed_ids:
+
+                    if self.is_processed(app_id):
                         continue
-                    
-                    if self.create_bitrix_lead(application):
-                        success_count += 1
-                    
-                    self.save_processed_id(app_id)
-                    processed_count += 1
-                    
-                    # Rate limiting
-                    time.sleep(2)
-                    
+
+                    fields = self._build_lead_fields(application)
+                    if fields is not None:
+                        pending.append((app_id, fields))
+
                 except Exception as e:
                     error_msg = f"Arizani qayta ishlashda xatolik: {str(e)}"
                     self.logger.error(error_msg)
                     continue
+
+            # 50 talik guruhlar bilan bitta batch.json chaqiruvi
+            for start in range(0, len(pending), self.BITRIX_BATCH_SIZE):
+                batch = pending[start:start + self.BITRIX_BATCH_SIZE]
+                success_count += self._flush_leads(batch)
+                for app_id, _ in batch:
+                    self.save_processed_id(app_id)
+                processed_count += len(batch)
             
+            # Batch tugadi - ID larni diskka yozish
+            self.flush_ids()
+
             # Hisobot yuborish
             if processed_count > 0:
                 summary_message = (
@@ -683,45 +1094,72 @@ class HeadHunterBitrixIntegration:
     def cleanup_old_processed_ids(self, days_to_keep: int = 30) -> None:
         """Eski processed ID larni tozalash"""
         try:
-            if not os.path.exists(self.processed_ids_file):
+            cutoff = int(time.time()) - days_to_keep * 86400
+
+            # O'chiriladigan yozuv yo'q bo'lsa backup ham, DELETE ham shart emas -
+            # odatiy holatda tozalash bitta indeksli EXISTS bilan tugaydi
+            with self._db_lock:
+                has_old = self._db.execute(
+                    'SELECT 1 FROM processed WHERE ts < ? LIMIT 1', (cutoff,)).fetchone()
+            if has_old is None:
                 return
-            
-            # Backup yaratish
-            backup_file = f"{self.processed_ids_file}.backup.{datetime.now().strftime('%Y%m%d')}"
+
+            # O'chirishdan oldin kunlik backup - sqlite backup API sahifalab
+            # ko'chiradi, butun fayl Python xotirasiga olinmaydi
+            backup_file = f"{self.processed_db_file}.backup.{time.strftime('%Y%m%d')}"
             if not os.path.exists(backup_file):
-                with open(self.processed_ids_file, 'r') as src:
-                    with open(backup_file, 'w') as dst:
-                        dst.write(src.read())
-            
-            # Fayl o'lchamini tekshirish
-            file_size = os.path.getsize(self.processed_ids_file)
-            if file_size > 10 * 1024 * 1024:  # 10MB dan katta bo'lsa
-                self.logger.info(f"Processed IDs fayli katta ({file_size/1024/1024:.1f}MB), tozalanmoqda...")
-                
-                # Oxirgi N ta ID ni saqlash
-                with open(self.processed_ids_file, 'r') as f:
-                    lines = f.readlines()
-                
-                # Oxirgi 10000 ta ID ni saqlash
-                keep_lines = lines[-10000:] if len(lines) > 10000 else lines
-                
-                with open(self.processed_ids_file, 'w') as f:
-                    f.writelines(keep_lines)
-                
-                # Memory dagi set ni yangilash
-                self.processed_ids = set(line.strip() for line in keep_lines if line.strip())
-                
-                self.logger.info(f"Processed IDs fayli tozalandi, {len(keep_lines)} ta ID saqlandi")
-        
+                backup_db = sqlite3.connect(backup_file)
+                try:
+                    with self._db_lock:
+                        # Ochiq yozish tranzaksiyasi bilan backup() abadiy
+                        # SQLITE_BUSY da aylanib qoladi - avval commit qilamiz
+                        self._db.commit()
+                        self._db.backup(backup_db, pages=1024)
+                finally:
+                    backup_db.close()
+            with self._db_lock, self._db:
+                deleted = self._db.execute('DELETE FROM processed WHERE ts < ?', (cutoff,)).rowcount
+
+            if deleted:
+                # Bo'shagan sahifalarni qaytarish va WAL ni chegaralash -
+                # tozalash file o'lchamidan mustaqil, O(o'chirilgan) bo'lib qoladi
+                with self._db_lock:
+                    self._db.execute('PRAGMA incremental_vacuum')
+                    self._db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                self.logger.info(f"{deleted} ta eski ID o'chirildi ({days_to_keep} kundan eski)")
+
         except Exception as e:
-            self.logger.error(f"Processed IDs faylini tozalashda xatolik: {str(e)}")
+            self.logger.error(f"Processed IDs ni tozalashda xatolik: {str(e)}")
     
+    # Bitrix probe natijasi shuncha sekund keshlanadi
+    BITRIX_PROBE_TTL = 300
+
+    # Health check probalari uchun kutish chegarasi (sekund)
+    HC_PROBE_TIMEOUT = 10
+
+    def _bitrix_accessible(self) -> bool:
+        """Bitrix ga kirishni tekshirish - read-only profile so'rovi bilan
+
+        Avvalgi test lead POST i har soatda CRM da chiqindi lead yaratardi;
+        profile o'qish hech narsani o'zgartirmaydi va natija 5 minut keshda
+        turadi.
+        """
+        now = time.monotonic()
+        if self._bitrix_probe_cache is not None and now - self._bitrix_probe_cache[0] < self.BITRIX_PROBE_TTL:
+            return self._bitrix_probe_cache[1]
+
+        response = self.make_request('GET', self.bitrix_api_base + '/profile.json')
+        accessible = response is not None and response.status_code == 200
+        self._bitrix_probe_cache = (now, accessible)
+        return accessible
+
     def health_check(self) -> Dict[str, any]:
         """Sistema holatini tekshirish"""
+        now = datetime.now()
         status = {
-            'timestamp': datetime.now().isoformat(),
-            'uptime_seconds': (datetime.now() - self.start_time).total_seconds(),
-            'processed_count': len(self.processed_ids),
+            'timestamp': now.isoformat(),
+            'uptime_seconds': time.monotonic() - self._start_monotonic,
+            'processed_count': self.processed_count(),
             'token_valid': False,
             'token_expires_at': self.token_expires_at.isoformat() if self.token_expires_at else None,
             'api_accessible': False,
@@ -729,51 +1167,115 @@ class HeadHunterBitrixIntegration:
         }
         
         try:
-            # Token tekshirish
+            # Ikkala probani parallel yuboramiz, natijani timeout bilan yig'amiz
+            api_future = None
+            bitrix_future = None
             if self.hh_access_token:
                 status['token_valid'] = True
-                api_ok, api_message = self.test_api_access()
-                status['api_accessible'] = api_ok
-                status['api_message'] = api_message
-            
-            # Bitrix tekshirish (test lead yaratish)
+                api_future = self._hc_pool.submit(self.test_api_access)
             if self.bitrix_webhook:
-                test_data = {'fields': {'TITLE': 'Health Check Test'}}
-                response = self.make_request('POST', self.bitrix_webhook, json=test_data)
-                status['bitrix_accessible'] = response is not None and response.status_code == 200
-            
+                bitrix_future = self._hc_pool.submit(self._bitrix_accessible)
+
+            if api_future is not None:
+                try:
+                    api_ok, api_message = api_future.result(timeout=self.HC_PROBE_TIMEOUT)
+                    status['api_accessible'] = api_ok
+                    status['api_message'] = api_message
+                except TimeoutError:
+                    status['api_message'] = f"Probe {self.HC_PROBE_TIMEOUT}s da javob bermadi"
+
+            if bitrix_future is not None:
+                try:
+                    status['bitrix_accessible'] = bitrix_future.result(timeout=self.HC_PROBE_TIMEOUT)
+                except TimeoutError:
+                    pass
+
         except Exception as e:
             status['health_check_error'] = str(e)
-        
+
         return status
     
+    def _run_job(self, fn) -> None:
+        """Jobni xatoliklardan himoyalangan holda bajarish (fon threadda)"""
+        try:
+            fn()
+        except Exception as e:
+            self.logger.error(f"Job xatolik ({getattr(fn, '__name__', fn)}): {str(e)}")
+
+    def _submit_job(self, fn) -> None:
+        """Jobni fon poolga topshirish
+
+        Scheduler tick hech qachon tarmoq I/O da bloklanmaydi; bitta jobning
+        avvalgi ishga tushishi hali tugamagan bo'lsa, bu tick tashlab yuboriladi.
+        """
+        with self._jobs_lock:
+            future = self._job_futures.get(fn)
+            if future is not None and not future.done():
+                self.logger.warning(f"{getattr(fn, '__name__', fn)} hali tugamagan, bu tick o'tkazib yuborildi")
+                return
+            self._job_futures[fn] = self._jobs_pool.submit(self._run_job, fn)
+
+    def _log_health(self) -> None:
+        """Health check natijasini logga yozish"""
+        self.logger.info(f"Health check: {self.health_check()}")
+
     def start_scheduler(self) -> None:
         """Scheduler ni boshlash"""
-        # Asosiy jarayon har 10 minutda
-        schedule.every(10).minutes.do(self.process_applications)
-        
-        # Tozalash har kunda
-        schedule.every().day.at("02:00").do(self.cleanup_old_processed_ids)
-        
-        # Health check har soatda
-        schedule.every().hour.do(lambda: self.logger.info(f"Health check: {self.health_check()}"))
-        
-        start_message = (
-            f"🚀 <b>HeadHunter-Bitrix24 tizimi ishga tushdi!</b>\n\n"
-            f"⏰ Tekshirish intervali: har 10 minut\n"
-            f"📅 Boshlash vaqti: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-            f"🔧 Versiya: 2.0 (yaxshilangan)"
-        )
+        # (deadline, tiebreak, interval, callback) min-heap: keyingi job
+        # O(log N) da topiladi, har tickda hamma joblarni skan qilinmaydi
+        now = time.monotonic()
+        self._timer_seq = itertools.count()
+        self._timers = []
+        for interval, callback in (
+                (600.0, self.process_applications),         # har 10 minutda
+                (86400.0, self.cleanup_old_processed_ids),  # har kunda
+                (3600.0, self._log_health),                 # har soatda
+                (60.0, self.flush_ids),                     # har minutda
+        ):
+            heapq.heappush(self._timers, (now + interval, next(self._timer_seq), interval, callback))
         
-        self.send_telegram_message(start_message)
+        self.send_telegram_message(self.START_TMPL.format(ts=time.strftime(_STRFTIME)))
         
         # Dastlabki tekshirish
         self.process_applications()
-        
+
+        # Kernel timeri orqali aniq uyg'onish - tick drift qilmaydi va CPU
+        # joblar orasida butunlay uxlaydi (timerfd Python 3.13+ da bor,
+        # bo'lmasa oddiy sleep ga qaytamiz)
+        timer_fd = None
+        if hasattr(os, 'timerfd_create'):
+            timer_fd = os.timerfd_create(time.CLOCK_MONOTONIC)
+
+        # Abadiy loop uchun locallar - har iteratsiyada LOAD_ATTR zanjiri
+        # o'rniga LOAD_FAST
+        monotonic = time.monotonic
+        sleep = time.sleep
+        heappop = heapq.heappop
+        heappush = heapq.heappush
+        submit_job = self._submit_job
+        timers = self._timers
+        timer_seq = self._timer_seq
+        log_error = self.logger.error
+        send_err = self.send_telegram_error
+
         while True:
             try:
-                schedule.run_pending()
-                time.sleep(30)
+                now = monotonic()
+                while timers and timers[0][0] <= now:
+                    _, _, interval, callback = heappop(timers)
+                    submit_job(callback)
+                    heappush(timers, (now + interval, next(timer_seq), interval, callback))
+
+                # Keyingi deadlinega qadar uxlash
+                wait = max(timers[0][0] - monotonic(), 0.001)
+                if timer_fd is not None:
+                    os.timerfd_settime(timer_fd, initial=wait, interval=0)
+                    os.read(timer_fd, 8)  # keyingi deadlinegacha bloklanadi
+                else:
+                    sleep(wait)
+
+                # Muvaffaqiyatli iteratsiya - backoff ni boshlang'ich qiymatga qaytarish
+                self._err_backoff = 30
             except KeyboardInterrupt:
                 stop_message = "🛑 Tizim to'xtatildi"
                 self.send_telegram_message(stop_message)
@@ -781,14 +1283,40 @@ class HeadHunterBitrixIntegration:
                 break
             except Exception as e:
                 error_msg = f"Scheduler xatolik: {str(e)}"
-                self.logger.error(error_msg)
-                self.send_telegram_error({}, error_msg)
-                time.sleep(60)
+                log_error(error_msg)
+                send_err({}, error_msg)
+                # Yopishqoq xatolikda har daqiqa urinish o'rniga eksponensial
+                # backoff (5 minutgacha) + jitter
+                self._err_backoff = min(self._err_backoff * 2, 300)
+                sleep(self._err_backoff + random.uniform(0, self._err_backoff * 0.1))
         
-        # Cleanup
+        # Cleanup - navbatdagi Telegram xabarlari yuborilib bo'lsin
+        if timer_fd is not None:
+            os.close(timer_fd)
+        self._tg_queue.join()
         self.session.close()
 
 
+def _ensure_token(integration: HeadHunterBitrixIntegration, max_retries: int = 3) -> Tuple[bool, str]:
+    """API ga kirishni ta'minlash - kerak bo'lsa tokenni yangilab qayta urinish
+
+    Avvalgi rekursiv main() chaqiruvi o'rniga bitta instance ustida
+    chegaralangan loop: __init__ (config o'qish, logger, DB) qayta ishlamaydi.
+    """
+    api_message = ''
+    for _ in range(max_retries):
+        api_ok, api_message = integration.test_api_access()
+        if api_ok:
+            return True, api_message
+        if "yaroqsiz" not in api_message and "muddati tugagan" not in api_message:
+            return False, api_message
+        print("🔄 Refresh token bilan yangilanmoqda...")
+        if not integration.refresh_access_token():
+            return False, api_message
+        print("✅ Token yangilandi, qayta urinilmoqda...")
+    return False, api_message
+
+
 def main():
     integration = HeadHunterBitrixIntegration()
     
@@ -816,27 +1344,22 @@ def main():
         return
     
     print("🔍 API access tekshirilmoqda...")
-    api_ok, api_message = integration.test_api_access()
-    
+    api_ok, api_message = _ensure_token(integration)
+
     if api_ok:
         print(f"✅ {api_message}")
-        
+
         # Health check
         health = integration.health_check()
         print(f"📊 Sistema holati: {health}")
-        
+
         print("🚀 Tizim ishga tushmoqda...")
         integration.start_scheduler()
     else:
         print(f"❌ {api_message}")
         if "yaroqsiz" in api_message or "muddati tugagan" in api_message:
-            print("🔄 Refresh token bilan yangilanmoqda...")
-            if integration.refresh_access_token():
-                print("✅ Token yangilandi, qayta urinib ko'ring")
-                main()  # Recursive call
-            else:
-                print("🔗 Yangi Authorization kerak:", integration.get_hh_authorization_url())
-                print("Token muddati tugagan va yangilab bo'lmayapti. Yangi token oling.")
+            print("🔗 Yangi Authorization kerak:", integration.get_hh_authorization_url())
+            print("Token muddati tugagan va yangilab bo'lmayapti. Yangi token oling.")
 
 
 if __name__ == "__main__":